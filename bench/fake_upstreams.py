@@ -0,0 +1,223 @@
+"""Local stand-ins for every upstream the API talks to
+
+Each provider is served on its own port with its own latency and error
+rate, so the benchmark never leaves the machine:
+
+    mobsf, ipdata, spamhaus, ipqualityscore, gemini, fcm_relay
+
+Optionally also serves an in-memory Redis (fakeredis) on `--redis-port`.
+
+Usage:
+    python bench/fake_upstreams.py --config config.json --ports ports.json
+
+`config.json` holds `{"upstreams": {"<provider>": {"latency_ms": ...,
+"jitter_ms": ..., "error_rate": ..., "malicious_rate": ...}}}` and
+`ports.json` maps each provider to the port it should listen on.
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+from aiohttp import web
+
+PROVIDERS = ("mobsf", "ipdata", "spamhaus", "ipqualityscore", "gemini", "fcm_relay")
+
+DEFAULT_UPSTREAM = {"latency_ms": 50, "jitter_ms": 10, "error_rate": 0.0, "malicious_rate": 0.05}
+
+
+def fake_jwt(ttl: int = 60 * 60 * 24) -> str:
+    def encode(part: dict) -> str:
+        return base64.urlsafe_b64encode(json.dumps(part).encode()).decode().rstrip("=")
+    now = int(time.time())
+    return f"{encode({'typ': 'JWT', 'alg': 'HS256'})}.{encode({'iat': now, 'exp': now + ttl})}.fake"
+
+
+@web.middleware
+async def simulate(request: web.Request, handler):
+    """Delay every response by the provider's latency, failing some on purpose"""
+    config = request.app["config"]
+    await asyncio.sleep(max(0.0, random.gauss(config["latency_ms"], config["jitter_ms"])) / 1000)
+    if random.random() < config["error_rate"]:
+        return web.json_response({"error": "injected failure"}, status=500)
+    return await handler(request)
+
+
+def _malicious(request: web.Request) -> bool:
+    return random.random() < request.app["config"]["malicious_rate"]
+
+
+# MobSF
+
+async def mobsf_upload(request: web.Request):
+    reader = await request.multipart()
+    md5 = hashlib.md5()
+    file_name = "upload.apk"
+    async for part in reader:
+        file_name = part.filename or file_name
+        while chunk := await part.read_chunk():
+            md5.update(chunk)
+    return web.json_response({"analyzer": "static_analyzer", "status": "success", "hash": md5.hexdigest(),
+                              "scan_type": "apk", "file_name": file_name})
+
+
+async def mobsf_scan(request: web.Request):
+    data = await request.post()
+    return web.json_response({"title": "Static Analysis", "md5": data.get("hash"), "version": "fake"})
+
+
+async def mobsf_report_json(request: web.Request):
+    data = await request.post()
+    return web.json_response({
+        "md5": data.get("hash"),
+        "app_name": "Benchmark App",
+        "package_name": "com.securenet.bench",
+        "permissions": {f"android.permission.PERM_{i}": {"status": "dangerous", "info": "fake"} for i in range(20)},
+        "manifest_analysis": {"manifest_findings": [{"rule": f"rule_{i}", "severity": "warning"} for i in range(10)]},
+        "code_analysis": {"findings": {f"finding_{i}": {"metadata": {"severity": "info"}} for i in range(10)}},
+        "strings": ["x" * 64] * 100,
+    })
+
+
+async def mobsf_scorecard(request: web.Request):
+    data = await request.post()
+    return web.json_response({"hash": data.get("hash"), "security_score": random.randint(0, 100)})
+
+
+async def mobsf_pdf(request: web.Request):
+    return web.Response(body=b"%PDF-1.4\n" + b"0" * 4096, content_type="application/pdf")
+
+
+# ipdata
+
+async def ipdata_report(request: web.Request):
+    malicious = _malicious(request)
+    return web.json_response({
+        "ip": request.match_info["ip"],
+        "country_code": "IN",
+        "threat": {"is_known_attacker": malicious, "is_known_abuser": malicious, "is_threat": malicious},
+    })
+
+
+# Spamhaus
+
+async def spamhaus_login(request: web.Request):
+    token = fake_jwt()
+    return web.json_response({"code": 200, "token": token, "expires": int(time.time()) + 60 * 60 * 24})
+
+
+async def spamhaus_domain(request: web.Request):
+    return web.json_response({
+        "domain": request.match_info["domain"],
+        "score": random.uniform(-5, -0.5) if _malicious(request) else random.uniform(0.5, 5),
+    })
+
+
+# IPQualityScore
+
+async def ipqualityscore_url(request: web.Request):
+    malicious = _malicious(request)
+    return web.json_response({
+        "success": True,
+        "unsafe": malicious,
+        "malware": malicious,
+        "phishing": False,
+        "suspicious": malicious,
+        "risk_score": 100 if malicious else random.randint(0, 40),
+    })
+
+
+# Gemini (REST transport of google-generativeai)
+
+async def gemini_generate(request: web.Request):
+    body = await request.read()
+    prompt_tokens = len(body) // 4
+    return web.json_response({
+        "candidates": [{
+            "content": {"parts": [{"text": "Review the app's permissions and uninstall it if you don't use it."}], "role": "model"},
+            "finishReason": "STOP",
+            "index": 0,
+        }],
+        "usageMetadata": {"promptTokenCount": prompt_tokens, "candidatesTokenCount": 16,
+                          "totalTokenCount": prompt_tokens + 16},
+    })
+
+
+# FCM relay
+
+async def fcm_notif(request: web.Request):
+    await request.json()
+    return web.json_response({"success": True})
+
+
+ROUTES = {
+    "mobsf": [
+        web.post("/api/v1/upload", mobsf_upload),
+        web.post("/api/v1/scan", mobsf_scan),
+        web.post("/api/v1/report_json", mobsf_report_json),
+        web.post("/api/v1/scorecard", mobsf_scorecard),
+        web.get("/pdf/{hash}/", mobsf_pdf),
+    ],
+    "ipdata": [web.get("/{ip}", ipdata_report)],
+    "spamhaus": [
+        web.post("/api/v1/login", spamhaus_login),
+        web.get("/api/intel/v2/byobject/domain/{domain}", spamhaus_domain),
+    ],
+    "ipqualityscore": [web.get("/api/json/url/{key}/{url:.*}", ipqualityscore_url)],
+    "gemini": [web.post("/{version}/models/{model}", gemini_generate)],
+    "fcm_relay": [web.post("/notif", fcm_notif)],
+}
+
+
+def make_app(provider: str, config: dict) -> web.Application:
+    app = web.Application(middlewares=[simulate], client_max_size=1 << 30)
+    app["config"] = {**DEFAULT_UPSTREAM, **config}
+    app.add_routes(ROUTES[provider])
+    return app
+
+
+async def serve(configs: dict, ports: dict, redis_port: int | None = None):
+    runners = []
+    for provider in PROVIDERS:
+        runner = web.AppRunner(make_app(provider, configs.get(provider, {})), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", ports[provider]).start()
+        runners.append(runner)
+
+    redis_server = None
+    if redis_port:
+        from fakeredis import TcpFakeServer
+        redis_server = TcpFakeServer(("127.0.0.1", redis_port))
+        asyncio.get_running_loop().run_in_executor(None, redis_server.serve_forever)
+
+    print("ready", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        if redis_server:
+            redis_server.shutdown()
+        for runner in runners:
+            await runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", help="JSON file with per-provider latency/error settings")
+    parser.add_argument("--ports", required=True, help="JSON file mapping provider -> port")
+    parser.add_argument("--redis-port", type=int, help="Also serve an in-memory Redis on this port")
+    args = parser.parse_args()
+
+    configs = {}
+    if args.config:
+        with open(args.config) as f:
+            configs = json.load(f).get("upstreams", {})
+    with open(args.ports) as f:
+        ports = json.load(f)
+
+    asyncio.run(serve(configs, ports, args.redis_port))
+
+
+if __name__ == "__main__":
+    main()
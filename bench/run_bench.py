@@ -0,0 +1,365 @@
+"""Reproducible load test for the SecureNet API
+
+Starts the local upstream stand-ins (bench/fake_upstreams.py), an
+in-memory Redis (unless `--redis-host` is given) and the API under uvicorn
+against a throwaway SQLite database, then drives each scenario at the
+configured concurrency levels and writes p50/p99 latency and throughput
+to a JSON file.
+
+Usage:
+    pip install -r bench/requirements.txt
+    python bench/run_bench.py --output bench_results.json
+    python bench/run_bench.py --config my_config.json --scenarios ipdom_ip,static_upload
+
+`--config` is merged over `DEFAULT_CONFIG` below, per top-level key.
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+import aiohttp
+import redis
+import requests
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_UPSTREAMS = os.path.join(REPO_DIR, "bench", "fake_upstreams.py")
+
+DEFAULT_CONFIG = {
+    "seed": 1337,
+    "workers": 1,
+    # Flush the report cache before every run so each one starts cold
+    "flush_cache": True,
+    "key_space": {"ips": 2000, "domains": 2000},
+    "upstreams": {
+        "mobsf": {"latency_ms": 200, "jitter_ms": 50, "error_rate": 0.0},
+        "ipdata": {"latency_ms": 80, "jitter_ms": 20, "error_rate": 0.01, "malicious_rate": 0.05},
+        "spamhaus": {"latency_ms": 120, "jitter_ms": 30, "error_rate": 0.01, "malicious_rate": 0.05},
+        "ipqualityscore": {"latency_ms": 150, "jitter_ms": 40, "error_rate": 0.01, "malicious_rate": 0.05},
+        "gemini": {"latency_ms": 1500, "jitter_ms": 300, "error_rate": 0.0},
+        "fcm_relay": {"latency_ms": 100, "jitter_ms": 20, "error_rate": 0.0},
+    },
+    "scenarios": {
+        "ipdom_ip": {"concurrency": [1, 16, 64], "requests": 2000},
+        "ipdom_domain": {"concurrency": [1, 16, 64], "requests": 2000},
+        "static_upload": {"concurrency": [1, 4], "requests": 20, "apk_sizes_kb": [256, 4096, 32768]},
+        "gemini_action": {"concurrency": [1, 8], "requests": 40},
+        "gemini_summary": {"concurrency": [1, 8], "requests": 40},
+        "blacklist_post": {"concurrency": [1, 16, 64], "requests": 2000},
+        "blacklist_get": {"concurrency": [1, 16, 64], "requests": 500},
+    },
+}
+
+PACKAGE = "com.securenet.bench"
+FAKE_MD5 = "5f06b231c5e9b1703b088ad87050c89f"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def synthetic_apk(size_kb: int, rng: random.Random) -> bytes:
+    """Zip laid out like an APK, padded with incompressible bytes to ~`size_kb`"""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as apk:
+        apk.writestr("AndroidManifest.xml", f'<manifest package="{PACKAGE}"/>')
+        apk.writestr("resources.arsc", rng.randbytes(1024))
+        apk.writestr("classes.dex", rng.randbytes(max(0, size_kb * 1024 - 2048)))
+    return buffer.getvalue()
+
+
+# Scenarios: each returns `(variant, request)` pairs, `request(session, base_url, i)`
+# issues one request and returns whether it succeeded.
+
+def ipdom_ip(config: dict, rng: random.Random):
+    ips = [f"203.0.{rng.randrange(256)}.{rng.randrange(256)}" for _ in range(config["key_space"]["ips"])]
+
+    async def request(session, base_url, i):
+        params = {"package": PACKAGE, "ip": ips[rng.randrange(len(ips))], "port": 443, "protocol": 6}
+        async with session.get(f"{base_url}/dynamic/ipdom", params=params) as response:
+            await response.read()
+            return response.status < 400
+    return [(None, request)]
+
+
+def ipdom_domain(config: dict, rng: random.Random):
+    domains = [f"host{rng.randrange(50)}.site{i}.com" for i in range(config["key_space"]["domains"])]
+
+    async def request(session, base_url, i):
+        params = {"package": PACKAGE, "domain": domains[rng.randrange(len(domains))], "protocol": 6}
+        async with session.get(f"{base_url}/dynamic/ipdom", params=params) as response:
+            await response.read()
+            return response.status < 400
+    return [(None, request)]
+
+
+def static_upload(config: dict, rng: random.Random):
+    variants = []
+    for size_kb in config["scenarios"]["static_upload"]["apk_sizes_kb"]:
+        apk = synthetic_apk(size_kb, rng)
+
+        async def request(session, base_url, i, apk=apk, size_kb=size_kb):
+            form = aiohttp.FormData()
+            form.add_field("file", apk, filename=f"bench_{size_kb}kb_{i}.apk",
+                           content_type="application/vnd.android.package-archive")
+            async with session.post(f"{base_url}/static/upload", data=form) as response:
+                await response.read()
+                return response.status < 400
+        variants.append((f"{size_kb}kb", request))
+    return variants
+
+
+# /gemini/* answer 200 with this text when MobSF or Gemini fails
+GEMINI_FALLBACK = "Not able to generate"
+
+
+def gemini_action(config: dict, rng: random.Random):
+    async def request(session, base_url, i):
+        async with session.get(f"{base_url}/gemini/action", params={"hash": FAKE_MD5}) as response:
+            body = await response.text()
+            return response.status < 400 and GEMINI_FALLBACK not in body
+    return [(None, request)]
+
+
+def gemini_summary(config: dict, rng: random.Random):
+    async def request(session, base_url, i):
+        async with session.get(f"{base_url}/gemini/summary", params={"hash": FAKE_MD5}) as response:
+            body = await response.text()
+            return response.status < 400 and GEMINI_FALLBACK not in body
+    return [(None, request)]
+
+
+def blacklist_post(config: dict, rng: random.Random):
+    async def request(session, base_url, i):
+        body = {"ip": f"198.51.100.{rng.randrange(256)}", "domain": f"bad{rng.randrange(1000)}.example"}
+        async with session.post(f"{base_url}/dynamic/blacklist", json=body) as response:
+            await response.read()
+            return response.status < 400
+    return [(None, request)]
+
+
+def blacklist_get(config: dict, rng: random.Random):
+    async def request(session, base_url, i):
+        async with session.get(f"{base_url}/dynamic/blacklist") as response:
+            await response.read()
+            return response.status < 400
+    return [(None, request)]
+
+
+SCENARIOS = {
+    "ipdom_ip": ipdom_ip,
+    "ipdom_domain": ipdom_domain,
+    "static_upload": static_upload,
+    "gemini_action": gemini_action,
+    "gemini_summary": gemini_summary,
+    "blacklist_post": blacklist_post,
+    "blacklist_get": blacklist_get,
+}
+
+
+def percentile(sorted_values: list[float], pct: float) -> float | None:
+    """Nearest-rank percentile"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+async def run_load(base_url: str, request, total: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    async def worker(session):
+        nonlocal errors, next_index
+        while next_index < total:
+            i = next_index
+            next_index += 1
+            start = time.perf_counter()
+            try:
+                if not await request(session, base_url, i):
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=600)) as session:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(session) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+        "max_ms": round(latencies[-1], 2) if latencies else None,
+    }
+
+
+def wait_until_ready(url: str, process: subprocess.Popen, timeout: float = 60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{process.args[:4]} exited with {process.returncode}")
+        try:
+            if requests.get(url, timeout=1).status_code < 500:
+                return
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+def load_config(path: str | None) -> dict:
+    config = json.loads(json.dumps(DEFAULT_CONFIG))
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(config.get(key), dict):
+                config[key].update(value)
+            else:
+                config[key] = value
+    return config
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_DIR, text=True).strip()
+    except Exception:
+        return None
+
+
+async def run_scenarios(config: dict, names: list[str], base_url: str, cache: redis.Redis) -> list[dict]:
+    results = []
+    for name in names:
+        scenario = config["scenarios"][name]
+        # Fresh RNG per scenario so adding/removing one doesn't shift the others
+        rng = random.Random(f"{config['seed']}:{name}")
+        for variant, request in SCENARIOS[name](config, rng):
+            for concurrency in scenario["concurrency"]:
+                if config["flush_cache"]:
+                    cache.flushdb()
+                result = await run_load(base_url, request, scenario["requests"], concurrency)
+                result = {"scenario": name, "variant": variant, "concurrency": concurrency, **result}
+                print(json.dumps(result), flush=True)
+                results.append(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", help="JSON file merged over the default config")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--scenarios", help=f"Comma separated subset of: {','.join(SCENARIOS)}")
+    parser.add_argument("--redis-host", help="Use this Redis instead of an in-memory one (db 0-2 get written!)")
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+
+    config = load_config(args.config)
+    names = args.scenarios.split(",") if args.scenarios else list(config["scenarios"])
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="securenet-bench-") as workdir:
+        try:
+            ports = {provider: free_port() for provider in config["upstreams"]}
+            with open(os.path.join(workdir, "ports.json"), "w") as f:
+                json.dump(ports, f)
+            with open(os.path.join(workdir, "config.json"), "w") as f:
+                json.dump(config, f)
+
+            redis_host, redis_port = args.redis_host, args.redis_port
+            upstream_args = [sys.executable, FAKE_UPSTREAMS,
+                             "--config", os.path.join(workdir, "config.json"),
+                             "--ports", os.path.join(workdir, "ports.json")]
+            if not redis_host:
+                redis_host, redis_port = "127.0.0.1", free_port()
+                upstream_args += ["--redis-port", str(redis_port)]
+            upstreams = subprocess.Popen(upstream_args, stdout=subprocess.PIPE, text=True)
+            processes.append(upstreams)
+            if upstreams.stdout.readline().strip() != "ready":
+                raise RuntimeError("Fake upstreams failed to start")
+
+            api_port = free_port()
+            env = {
+                **os.environ,
+                "URL_DATABASE": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+                "REDIS_HOST": redis_host,
+                "REDIS_PORT": str(redis_port),
+                "MOBSF_ENDPOINT": f"http://127.0.0.1:{ports['mobsf']}",
+                "MOBSF_API_KEY": "bench",
+                "IPDATA_ENDPOINT": f"http://127.0.0.1:{ports['ipdata']}",
+                "IPDATA_API_KEY": "bench",
+                "SPAMHAUS_ENDPOINT": f"http://127.0.0.1:{ports['spamhaus']}",
+                "SPAMHAUS_USERNAME": "bench",
+                "SPAMHAUS_PASSWORD": "bench",
+                "IPQUALITYSCORE_ENDPOINT": f"http://127.0.0.1:{ports['ipqualityscore']}",
+                "IPQUALITYSCORE_API_KEY": "bench",
+                "GEMINI_ENDPOINT": f"http://127.0.0.1:{ports['gemini']}",
+                "GEMINI_API_KEY": "bench",
+                "NOTIF_ENDPOINT": f"http://127.0.0.1:{ports['fcm_relay']}",
+                "LOG_LEVEL": "WARNING",
+            }
+            if config["workers"] > 1:
+                env["PROMETHEUS_MULTIPROC_DIR"] = os.path.join(workdir, "prometheus")
+                os.makedirs(env["PROMETHEUS_MULTIPROC_DIR"])
+            api = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", REPO_DIR,
+                 "--host", "127.0.0.1", "--port", str(api_port),
+                 "--workers", str(config["workers"]), "--log-level", "warning", "--no-access-log"],
+                cwd=workdir, env=env)
+            processes.append(api)
+            base_url = f"http://127.0.0.1:{api_port}"
+            wait_until_ready(f"{base_url}/metrics", api)
+
+            # Malicious hits only notify once an FCM token is registered
+            requests.post(f"{base_url}/fcm", json={"token": "bench"})
+
+            cache = redis.Redis(host=redis_host, port=redis_port, db=0)
+            started_at = time.time()
+            results = asyncio.run(run_scenarios(config, names, base_url, cache))
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    with open(args.output, "w") as f:
+        json.dump({
+            "meta": {
+                "started_at": started_at,
+                "git_commit": git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "config": config,
+            },
+            "results": results,
+        }, f, indent=2)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import asyncio
+import json
+import os
+import threading
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from ipdata_utils import fetch_ip_report
+from spamhaus_utils import fetch_domain_report
+from redis_utils import check_ip_report, add_ip_report, check_domain_report, add_domain_report, get_report_ttls, claim_report_refresh
+from logging_utils import get_logger
+from metrics_utils import CACHE_WARMER_REFRESHES
+
+load_dotenv()
+
+logger = get_logger("cache_warmer")
+
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "true").lower() == "true"
+CACHE_WARMER_INTERVAL = int(os.getenv("CACHE_WARMER_INTERVAL", 60 * 5))  # Seconds between cycles
+CACHE_WARMER_CAPACITY = int(os.getenv("CACHE_WARMER_CAPACITY", 1024))  # Keys tracked by the sketch
+CACHE_WARMER_MIN_HITS = int(os.getenv("CACHE_WARMER_MIN_HITS", 3))  # Per cycle, to count as hot
+CACHE_WARMER_BUDGET = int(os.getenv("CACHE_WARMER_BUDGET", 50))  # Upstream calls per cycle
+CACHE_WARMER_REFRESH_BEFORE = int(os.getenv("CACHE_WARMER_REFRESH_BEFORE", 60 * 60 * 24))  # 1 Day before expiry
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters sketch (Metwally et al.)
+
+    Tracks at most `capacity` keys. A new key arriving when full replaces
+    one with the lowest count and inherits that count, so counts are upper
+    bounds overestimated by at most `error`. Keys are grouped into buckets
+    by count, which keeps `add` O(1).
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._counts: dict = {}
+        self._errors: dict = {}
+        self._buckets: dict[int, dict] = {}
+        self._min = 0
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def _bucket_add(self, key, count: int):
+        self._buckets.setdefault(count, {})[key] = None
+
+    def _bucket_remove(self, key, count: int):
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+
+    def add(self, key):
+        count = self._counts.get(key)
+        if count is not None:
+            self._bucket_remove(key, count)
+            self._bucket_add(key, count + 1)
+            self._counts[key] = count + 1
+            if count == self._min and count not in self._buckets:
+                self._min = count + 1
+            return
+
+        if len(self._counts) < self.capacity:
+            self._counts[key] = 1
+            self._errors[key] = 0
+            self._bucket_add(key, 1)
+            self._min = 1
+            return
+
+        # Full: evict the oldest key with the lowest count
+        victim = next(iter(self._buckets[self._min]))
+        self._bucket_remove(victim, self._min)
+        del self._counts[victim]
+        del self._errors[victim]
+
+        self._counts[key] = self._min + 1
+        self._errors[key] = self._min
+        self._bucket_add(key, self._min + 1)
+        if self._min not in self._buckets:
+            self._min += 1
+
+    def top(self, n: int | None = None) -> list[tuple]:
+        """`(key, count, error)` for the `n` most frequent keys, highest first"""
+        ranked = sorted(self._counts.items(), key=lambda item: item[1], reverse=True)[:n]
+        return [(key, count, self._errors[key]) for key, count in ranked]
+
+
+# Refreshers raise when upstream gives no usable report, so a failed refresh
+# leaves the cached verdict and its TTL as they are
+def _refresh_ip(ip: str):
+    cached = check_ip_report(ip)
+    request = json.loads(cached).get("request", {}) if cached else {}
+    report = fetch_ip_report(ip)
+    report['request'] = request
+    add_ip_report(ip, request.get("port"), request.get("package"), json.dumps(report))
+
+
+def _refresh_domain(domain: str):
+    cached = check_domain_report(domain)
+    request = json.loads(cached).get("request", {}) if cached else {}
+    report = fetch_domain_report(domain)
+    report['request'] = request
+    add_domain_report(domain, request.get("package"), json.dumps(report))
+
+
+_REFRESHERS = {"ip": _refresh_ip, "domain": _refresh_domain}
+
+
+class CacheWarmer:
+    """Keeps hot IP/domain reports in Redis from expiring
+
+    `record` is called for every lookup. Each cycle the keys requested at
+    least `min_hits` times since the last cycle are refreshed, hottest
+    first, if their report is missing or expires within `refresh_before`,
+    spending at most `budget` upstream calls. The sketch is reset each
+    cycle so keys drop out as soon as devices stop asking for them.
+    """
+
+    def __init__(self, capacity: int = CACHE_WARMER_CAPACITY, min_hits: int = CACHE_WARMER_MIN_HITS,
+                 budget: int = CACHE_WARMER_BUDGET, refresh_before: int = CACHE_WARMER_REFRESH_BEFORE,
+                 interval: int = CACHE_WARMER_INTERVAL):
+        self.capacity = capacity
+        self.min_hits = min_hits
+        self.budget = budget
+        self.refresh_before = refresh_before
+        self.interval = interval
+        self._sketch = SpaceSaving(capacity)
+        # Lookups are recorded from both the event loop and the threadpool
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, key: str):
+        with self._lock:
+            self._sketch.add((kind, key))
+
+    def hot_keys(self) -> list[tuple[str, str]]:
+        """Hot `(kind, key)` pairs since the last call, hottest first. Resets the sketch"""
+        with self._lock:
+            sketch, self._sketch = self._sketch, SpaceSaving(self.capacity)
+        return [key for key, count, error in sketch.top() if count - error >= self.min_hits]
+
+    async def warm_once(self) -> int:
+        """Run one warming cycle, returns the number of upstream calls made"""
+        hot = self.hot_keys()
+        if not hot:
+            return 0
+
+        ttls = await run_in_threadpool(get_report_ttls, [key for _, key in hot])
+        spent = 0
+        for (kind, key), ttl in zip(hot, ttls):
+            if spent >= self.budget:
+                break
+            # -1: no expiry set, nothing to refresh
+            if ttl == -1 or ttl > self.refresh_before:
+                continue
+            if not await run_in_threadpool(claim_report_refresh, key, self.interval):
+                continue
+
+            spent += 1
+            try:
+                await run_in_threadpool(_REFRESHERS[kind], key)
+                CACHE_WARMER_REFRESHES.labels(kind, "success").inc()
+            except Exception:
+                CACHE_WARMER_REFRESHES.labels(kind, "error").inc()
+                logger.exception("Cache warmer refresh failed", extra={"kind": kind, "key": key})
+
+        logger.info("Cache warmer cycle", extra={"hot_keys": len(hot), "refreshed": spent})
+        return spent
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.warm_once()
+            except Exception:
+                logger.exception("Cache warmer cycle failed")
+
+
+cache_warmer = CacheWarmer()
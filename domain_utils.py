@@ -0,0 +1,34 @@
+import functools
+import os
+import pathlib
+from dotenv import load_dotenv
+import tldextract
+
+load_dotenv()
+
+# Optional local copy of the public suffix list, otherwise the snapshot
+# bundled with tldextract is used. Never fetched over the network.
+PUBLIC_SUFFIX_LIST_FILE = os.getenv("PUBLIC_SUFFIX_LIST_FILE")
+DOMAIN_LRU_SIZE = int(os.getenv("DOMAIN_LRU_SIZE", 1 << 16))
+
+_extractor = tldextract.TLDExtract(
+    cache_dir=None,
+    suffix_list_urls=(pathlib.Path(PUBLIC_SUFFIX_LIST_FILE).resolve().as_uri(),) if PUBLIC_SUFFIX_LIST_FILE else (),
+    fallback_to_snapshot=True,
+)
+# Build the suffix trie now rather than on the first lookup
+_extractor("example.com")
+
+
+@functools.lru_cache(maxsize=DOMAIN_LRU_SIZE)
+def registered_domain(domain: str) -> str:
+    """Normalized registered domain, e.g. `a.cdn.example.co.uk` -> `example.co.uk`
+
+    Falls back to the normalized input for names without a public suffix
+    (IP addresses, `localhost`, ...).
+    """
+    domain = domain.strip().lower().rstrip(".")
+    extracted = _extractor(domain)
+    if extracted.domain and extracted.suffix:
+        return '{}.{}'.format(extracted.domain, extracted.suffix)
+    return domain
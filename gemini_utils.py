@@ -7,6 +7,8 @@ import markdown
 load_dotenv()
 
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Overrides the Gemini API host (REST transport), e.g. to point at a local stand-in
+GEMINI_ENDPOINT = os.getenv("GEMINI_ENDPOINT")
 
 BASE_PROMPT_ACTION = """
 Analyze the following static analysis report of an app and suggest the possible action that the client user should take on his phone based on the report findings.
@@ -1,13 +1,33 @@
 import requests
 import os
 from dotenv import load_dotenv
+from metrics_utils import track_upstream
 
 load_dotenv()
 
+IPDATA_ENDPOINT = os.getenv("IPDATA_ENDPOINT", "https://api.ipdata.co")
+
+
+def _ip_lookup(ip: str) -> requests.Response:
+    with track_upstream("ipdata", "ip_report") as call:
+        response = requests.get(
+            f"{IPDATA_ENDPOINT}/{ip}?api-key={os.environ['IPDATA_API_KEY']}")
+        call.status(response.status_code)
+    return response
+
 
 def ip_report(ip: str):
-    response = requests.get(
-        f"https://api.ipdata.co/{ip}?api-key={os.environ['IPDATA_API_KEY']}")
+    response = _ip_lookup(ip).json()
+    response['type'] = 'ip'
+    return response
+
+
+def fetch_ip_report(ip: str):
+    """Like `ip_report`, but raises instead of returning an upstream error body"""
+    response = _ip_lookup(ip)
+    response.raise_for_status()
     response = response.json()
+    if "threat" not in response:
+        raise ValueError(f"ipdata report for {ip} has no threat data")
     response['type'] = 'ip'
     return response
\ No newline at end of file
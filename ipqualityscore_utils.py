@@ -0,0 +1,190 @@
+import aiohttp
+import asyncio
+import fnmatch
+import json
+import os
+import urllib.parse
+from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+from redis_utils import check_url_report, check_url_reports, add_url_report
+from logging_utils import get_logger
+from metrics_utils import record_cache, track_upstream
+
+load_dotenv()
+
+logger = get_logger("ipqualityscore")
+
+IPQUALITYSCORE_ENDPOINT = os.getenv("IPQUALITYSCORE_ENDPOINT", "https://www.ipqualityscore.com")
+IPQUALITYSCORE_API_URL = f"{IPQUALITYSCORE_ENDPOINT}/api/json/url"
+
+# Query params matching any of these (fnmatch) patterns are dropped before
+# the URL is used as a cache key, e.g. "utm_*,fbclid,gclid"
+URL_STRIP_PARAMS = [p.strip().lower() for p in os.getenv(
+    "URL_STRIP_PARAMS",
+    "utm_*,fbclid,gclid,dclid,gbraid,wbraid,msclkid,yclid,mc_cid,mc_eid,_ga,_gl,igshid,ref_src"
+).split(",") if p.strip()]
+
+# Hosts (fnmatch) whose whole query string is dropped, for ad/tracking hosts
+# where every impression carries a unique query, e.g. "*.doubleclick.net"
+URL_DROP_QUERY_HOSTS = [h.strip().lower() for h in os.getenv(
+    "URL_DROP_QUERY_HOSTS", "").split(",") if h.strip()]
+
+# Cache TTL per verdict (seconds), 0 disables caching for that verdict
+URL_REPORT_TTL = {
+    "malicious": int(os.getenv("URL_REPORT_TTL_MALICIOUS", 60 * 60 * 24 * 7)),  # 7 Days
+    "suspicious": int(os.getenv("URL_REPORT_TTL_SUSPICIOUS", 60 * 60 * 6)),  # 6 Hours
+    "clean": int(os.getenv("URL_REPORT_TTL_CLEAN", 60 * 60 * 24)),  # 1 Day
+    "error": int(os.getenv("URL_REPORT_TTL_ERROR", 0)),
+}
+
+URL_REPORT_TIMEOUT = float(os.getenv("URL_REPORT_TIMEOUT", 10))
+
+# Max IPQualityScore requests in flight from this process
+_upstream_semaphore = asyncio.Semaphore(
+    int(os.getenv("IPQUALITYSCORE_MAX_CONCURRENCY", 8)))
+
+_session: aiohttp.ClientSession | None = None
+
+# Normalized URL -> pending lookup, shared by concurrent cache misses
+_inflight: dict[str, asyncio.Task] = {}
+
+_DEFAULT_PORTS = {"http": 80, "https": 443}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form of `url` used as the cache key and sent upstream
+
+    Lowercases scheme and host, drops default ports, fragments and
+    tracking params (`URL_STRIP_PARAMS`, or the whole query for
+    `URL_DROP_QUERY_HOSTS`) and sorts the remaining query params.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = f"http://{url}"
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").rstrip(".")
+    # `hostname` drops the brackets around IPv6 literals
+    netloc = f"[{host}]" if ":" in host else host
+    if parts.port and parts.port != _DEFAULT_PORTS.get(scheme):
+        netloc = f"{netloc}:{parts.port}"
+    if parts.username:
+        netloc = f"{parts.username}@{netloc}"
+
+    query = ""
+    if not any(fnmatch.fnmatchcase(host, pattern) for pattern in URL_DROP_QUERY_HOSTS):
+        params = [
+            (name, value)
+            for name, value in urllib.parse.parse_qsl(parts.query, keep_blank_values=True)
+            if not any(fnmatch.fnmatchcase(name.lower(), pattern) for pattern in URL_STRIP_PARAMS)
+        ]
+        query = urllib.parse.urlencode(sorted(params))
+
+    return urllib.parse.urlunsplit((scheme, netloc, parts.path or "/", query, ""))
+
+
+def url_verdict(report: dict) -> str:
+    if not report.get("success"):
+        return "error"
+    risk_score = report.get("risk_score") or 0
+    if report.get("malware") or report.get("phishing") or risk_score >= 85:
+        return "malicious"
+    if report.get("suspicious") or report.get("unsafe") or risk_score >= 75:
+        return "suspicious"
+    return "clean"
+
+
+async def _get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=URL_REPORT_TIMEOUT))
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+
+async def _request_url_report(url: str) -> dict:
+    session = await _get_session()
+    async with _upstream_semaphore:
+        with track_upstream("ipqualityscore", "url_report") as call:
+            async with session.get(
+                    f"{IPQUALITYSCORE_API_URL}/{os.environ['IPQUALITYSCORE_API_KEY']}/{urllib.parse.quote(url, safe='')}") as response:
+                call.status(response.status)
+                report = await response.json(content_type=None)
+            if not report.get("success"):
+                call.fail()
+    return report
+
+
+async def _fetch_url_report(url: str) -> dict:
+    report = await _request_url_report(url)
+    ttl = URL_REPORT_TTL[url_verdict(report)]
+    if ttl > 0:
+        await run_in_threadpool(add_url_report, url, json.dumps(report), ttl)
+    return report
+
+
+async def _coalesced_fetch(normalized: str) -> dict:
+    """Fetch `normalized` upstream, sharing the call with concurrent misses"""
+    task = _inflight.get(normalized)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_url_report(normalized))
+        _inflight[normalized] = task
+        task.add_done_callback(lambda _: _inflight.pop(normalized, None))
+
+    # Shield so a disconnecting client doesn't cancel the other waiters
+    report = await asyncio.shield(task)
+    return dict(report)
+
+
+def _cached_report(normalized: str, url_report_redis) -> dict | None:
+    record_cache("url", bool(url_report_redis))
+    if url_report_redis:
+        logger.debug("URL Check: Cache Hit!", extra={"url": normalized})
+        return json.loads(url_report_redis)
+    logger.debug("URL Check: No Cache Found!", extra={"url": normalized})
+    return None
+
+
+async def url_report(url: str) -> dict:
+    """IPQualityScore report for `url`, served from Redis when possible
+
+    Concurrent misses for the same normalized URL share one upstream call.
+    Returns a fresh dict the caller is free to modify.
+    """
+    normalized = normalize_url(url)
+    cached = _cached_report(normalized, await run_in_threadpool(check_url_report, normalized))
+    if cached is not None:
+        return cached
+    return await _coalesced_fetch(normalized)
+
+
+async def url_reports(urls: list[str]) -> list[dict]:
+    """Batch variant of `url_report`, results follow the order of `urls`
+
+    The cache is read with a single MGET. A failed lookup yields
+    `{"url": ..., "error": ...}` in its slot instead of failing the batch.
+    """
+    normalized = [normalize_url(url) for url in urls]
+    cached = await run_in_threadpool(check_url_reports, normalized)
+
+    async def lookup(key: str, url_report_redis) -> dict:
+        report = _cached_report(key, url_report_redis)
+        return report if report is not None else await _coalesced_fetch(key)
+
+    results = await asyncio.gather(*(lookup(key, value) for key, value in zip(normalized, cached)),
+                                   return_exceptions=True)
+    reports = []
+    for url, result in zip(urls, results):
+        if isinstance(result, BaseException):
+            reports.append({"url": url, "error": str(result)})
+        else:
+            result["url"] = url
+            reports.append(result)
+    return reports
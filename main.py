@@ -1,5 +1,7 @@
-from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Response, Request
-from gemini_utils import BASE_PROMPT_ACTION, BASE_PROMPT_SUMMARY, GEMINI_API_KEY
+from fastapi import FastAPI, HTTPException, Depends, status, File, UploadFile, Response, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
+from starlette.websockets import WebSocketState
+from gemini_utils import BASE_PROMPT_ACTION, BASE_PROMPT_SUMMARY, GEMINI_API_KEY, GEMINI_ENDPOINT
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel
 from typing import List
@@ -17,10 +19,14 @@ from ipdata_utils import ip_report
 import json
 from redis_utils import check_ip_report, add_ip_report, check_domain_report, add_domain_report, add_ip_to_blacklist, add_domain_to_blacklist, get_blacklisted_ips, get_blacklisted_domains
 from spamhaus_utils import domain_report
-import urllib.parse
+from domain_utils import registered_domain
+from ipqualityscore_utils import url_report as ipqs_url_report, url_reports as ipqs_url_reports, close_session as ipqs_close_session
 import google.generativeai as genai
 import random
 from shared_utils import check_app_on_server
+from logging_utils import get_logger
+from cache_warmer import cache_warmer, CACHE_WARMER_ENABLED
+from metrics_utils import REQUEST_LATENCY, MOBSF_SCAN_DURATION, GEMINI_LATENCY, record_cache, track_upstream, record_gemini_usage, latest_metrics
 from pydantic import BaseModel
 # TODO: Implement async calls for notifs
 import aiohttp
@@ -30,11 +36,55 @@ load_dotenv()
 
 app = FastAPI()
 
+logger = get_logger("main")
+
 fcmToken = ""
 
+NOTIF_ENDPOINT = os.getenv("NOTIF_ENDPOINT", "https://securenet-notif.onrender.com")
+URL_REPORT_BATCH_MAX = int(os.getenv("URL_REPORT_BATCH_MAX", 500))
+IPDOM_STREAM_MAX_PENDING = int(os.getenv("IPDOM_STREAM_MAX_PENDING", 64))
+
 models.Base.metadata.create_all(bind=engine)
 
 
+cache_warmer_task: asyncio.Task | None = None
+
+
+@app.on_event("startup")
+async def startup():
+    global cache_warmer_task
+    if CACHE_WARMER_ENABLED:
+        cache_warmer_task = asyncio.create_task(cache_warmer.run())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    if cache_warmer_task:
+        cache_warmer_task.cancel()
+    await ipqs_close_session()
+
+
+@app.middleware("http")
+async def observe_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template so path params don't blow up cardinality
+        route = request.scope.get("route")
+        REQUEST_LATENCY.labels(request.method, route.path if route else "unmatched",
+                               status_code).observe(time.perf_counter() - start)
+
+
+@app.get("/metrics")
+async def metrics():
+    content, content_type = latest_metrics()
+    return Response(content=content, media_type=content_type)
+
+
 class AppCreate(BaseModel):
     package_name: str
     app_name: str
@@ -152,12 +202,12 @@ async def upload_apk(file: UploadFile = File(...)):
                 sha_hash.update(chunk)
 
         file_hash = sha_hash.hexdigest()
-        print(
-            f"SHA256 Hash of the file {file.filename}: {file_hash}")
+        logger.info("APK uploaded", extra={"file_name": file.filename, "md5": file_hash})
 
         # time.sleep(1)  # !TEST
 
-        with open(temp_file_path, "rb") as f:
+        scan_start = time.perf_counter()
+        with open(temp_file_path, "rb") as f, track_upstream("mobsf", "upload") as call:
             multipart_data = MultipartEncoder(
                 fields={'file': (temp_file_path, f, 'application/octet-stream')})
             response = requests.post(
@@ -166,33 +216,57 @@ async def upload_apk(file: UploadFile = File(...)):
                 headers={'Content-Type': multipart_data.content_type,
                          "Authorization": os.environ['MOBSF_API_KEY']}
             )
+            call.status(response.status_code)
 
         os.remove(temp_file_path)
 
         # Scan
-        response = requests.post(f"{os.environ['MOBSF_ENDPOINT']}/api/v1/scan",
-                                 data={
-                                     "hash": file_hash
-                                 },
-                                 headers={
-                                     "Authorization": os.environ['MOBSF_API_KEY']}
-                                 )
+        with track_upstream("mobsf", "scan") as call:
+            response = requests.post(f"{os.environ['MOBSF_ENDPOINT']}/api/v1/scan",
+                                     data={
+                                         "hash": file_hash
+                                     },
+                                     headers={
+                                         "Authorization": os.environ['MOBSF_API_KEY']}
+                                     )
+            call.status(response.status_code)
+        MOBSF_SCAN_DURATION.observe(time.perf_counter() - scan_start)
 
         return {"static": response.json(), "file_md5": file_hash}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def gemini_generate(prompt: str, endpoint: str) -> str:
+    if GEMINI_ENDPOINT:
+        genai.configure(api_key=GEMINI_API_KEY, transport="rest",
+                        client_options={"api_endpoint": GEMINI_ENDPOINT})
+    else:
+        genai.configure(api_key=GEMINI_API_KEY)
+
+    model = genai.GenerativeModel('gemini-pro')
+
+    start = time.perf_counter()
+    with track_upstream("gemini", "generate_content"):
+        response = model.generate_content(prompt)
+    GEMINI_LATENCY.labels(endpoint).observe(time.perf_counter() - start)
+    record_gemini_usage(endpoint, response)
+
+    return response.text
+
+
 @app.get("/gemini/action")
 async def gemini_action(hash: str):
     try:
-        response = requests.post(f"{os.environ['MOBSF_ENDPOINT']}/api/v1/report_json",
-                                data={
-                                    "hash": hash
-                                },
-                                headers={
-                                    "Authorization": os.environ['MOBSF_API_KEY']}
-                                )
+        with track_upstream("mobsf", "report_json") as call:
+            response = requests.post(f"{os.environ['MOBSF_ENDPOINT']}/api/v1/report_json",
+                                    data={
+                                        "hash": hash
+                                    },
+                                    headers={
+                                        "Authorization": os.environ['MOBSF_API_KEY']}
+                                    )
+            call.status(response.status_code)
 
         # !DEBUG LINE
         # print(response.text)
@@ -221,13 +295,7 @@ async def gemini_action(hash: str):
         # !DEBUG LINE
         # print(action_prompt)
 
-        genai.configure(api_key=GEMINI_API_KEY)
-
-        model = genai.GenerativeModel('gemini-pro')
-
-        response = model.generate_content(action_prompt)
-
-        return response.text
+        return gemini_generate(action_prompt, "action")
     except:
         return "Not able to generate action due to Gemini's context limit (30K Tokens)"
 
@@ -235,13 +303,15 @@ async def gemini_action(hash: str):
 @app.get("/gemini/summary")
 async def gemini_summary(hash: str):
     try:
-        response = requests.post(f"{os.environ['MOBSF_ENDPOINT']}/api/v1/report_json",
-                                data={
-                                    "hash": hash
-                                },
-                                headers={
-                                    "Authorization": os.environ['MOBSF_API_KEY']}
-                                )
+        with track_upstream("mobsf", "report_json") as call:
+            response = requests.post(f"{os.environ['MOBSF_ENDPOINT']}/api/v1/report_json",
+                                    data={
+                                        "hash": hash
+                                    },
+                                    headers={
+                                        "Authorization": os.environ['MOBSF_API_KEY']}
+                                    )
+            call.status(response.status_code)
 
         # Remove garbage value
         response = response.json()
@@ -263,13 +333,7 @@ async def gemini_summary(hash: str):
         response.pop('secrets', None)
 
         action_prompt = BASE_PROMPT_SUMMARY + json.dumps(response)
-        genai.configure(api_key=GEMINI_API_KEY)
-
-        model = genai.GenerativeModel('gemini-pro')
-
-        response = model.generate_content(action_prompt)
-
-        return response.text
+        return gemini_generate(action_prompt, "summary")
     except:
         return "Not able to generate summary due to Gemini's context limit (30K Tokens)"
 
@@ -294,11 +358,13 @@ async def scorecard(hash: str):
     """
     try:
         mobsf_api_url = f"{os.environ['MOBSF_ENDPOINT']}/api/v1/scorecard"
-        response = requests.post(
-            mobsf_api_url,
-            data={'hash': hash},
-            headers={"Authorization": os.environ['MOBSF_API_KEY']}
-        )
+        with track_upstream("mobsf", "scorecard") as call:
+            response = requests.post(
+                mobsf_api_url,
+                data={'hash': hash},
+                headers={"Authorization": os.environ['MOBSF_API_KEY']}
+            )
+            call.status(response.status_code)
         return response.json()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -324,11 +390,13 @@ async def report_json(hash: str):
     """
     try:
         mobsf_api_url = f"{os.environ['MOBSF_ENDPOINT']}/api/v1/report_json"
-        response = requests.post(
-            mobsf_api_url,
-            data={'hash': hash},
-            headers={"Authorization": os.environ['MOBSF_API_KEY']}
-        )
+        with track_upstream("mobsf", "report_json") as call:
+            response = requests.post(
+                mobsf_api_url,
+                data={'hash': hash},
+                headers={"Authorization": os.environ['MOBSF_API_KEY']}
+            )
+            call.status(response.status_code)
         if response.status_code == 200:
             return response.json()
         else:
@@ -357,8 +425,10 @@ async def report_pdf(hash: str):
     """
     try:
         query = f"{os.environ['MOBSF_ENDPOINT']}/pdf/{hash}/"
-        print(query)
-        response = requests.get(query)
+        logger.debug("Fetching MobSF PDF report", extra={"url": query})
+        with track_upstream("mobsf", "report_pdf") as call:
+            response = requests.get(query)
+            call.status(response.status_code)
         return Response(content=response.content, media_type="application/pdf")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -370,14 +440,14 @@ async def fcm_init(request: Request):
     token = data.get("token")
     global fcmToken
     fcmToken = token
-    print("fcmToken:", fcmToken)  # !DEBUG
+    logger.debug("FCM token set", extra={"fcm_token": fcmToken})
     return {"success": True, "fcmToken": token}
 
 
 async def send_notif(title: str, body: str):
     global fcmToken
     if fcmToken == "":
-        print("FCM token not set")
+        logger.warning("FCM token not set")
         return {"message": "set FCM TOKEN first"}
     # response = requests.post(
     #     "https://securenet-notif.onrender.com/notif",
@@ -386,13 +456,15 @@ async def send_notif(title: str, body: str):
     # )
     # return response.json()
     async with aiohttp.ClientSession() as session:
-        print("Sending notif...")
-        async with session.post(
-            "https://securenet-notif.onrender.com/notif",
-            json={'fcmToken': fcmToken, 'title': title, 'body': body},
-            headers={"Content-Type": "application/json"}
-        ) as response:
-            return await response.json()
+        logger.info("Sending notif", extra={"title": title, "body": body})
+        with track_upstream("fcm_relay", "notif") as call:
+            async with session.post(
+                f"{NOTIF_ENDPOINT}/notif",
+                json={'fcmToken': fcmToken, 'title': title, 'body': body},
+                headers={"Content-Type": "application/json"}
+            ) as response:
+                call.status(response.status)
+                return await response.json()
 
 
 @app.get("/tests/notif")
@@ -404,9 +476,27 @@ async def test_notif():
 # import pickle
 
 
-@app.get("/dynamic/ipdom")
-async def ip_or_domain_report(package: str, port: int | None = None, ip: str | None = None, domain: str | None = None, protocol: int | None = None):
-    # type = "ip"
+def _is_malicious_ip(report: dict) -> bool:
+    try:
+        threat = report["threat"]
+        return bool(threat['is_known_attacker'] and threat['is_known_abuser'] and threat['is_threat'])
+    except:
+        return False
+
+
+def _is_malicious_domain(report: dict) -> bool:
+    try:
+        return report['score'] < 0
+    except:
+        return False
+
+
+def ip_or_domain_lookup(package: str, port: int | None = None, ip: str | None = None, domain: str | None = None, protocol: int | None = None) -> tuple[dict, str | None]:
+    """Cached IP/domain report, shared by the HTTP and WebSocket routes
+
+    Returns:
+        tuple[dict, str | None]: The report and, if it is malicious, the alert title
+    """
     if ip:
         # source_ip = "192.168.100.103"
 
@@ -438,27 +528,15 @@ async def ip_or_domain_report(package: str, port: int | None = None, ip: str | N
         # except Exception:
         #     print("Could not predict")
 
+        cache_warmer.record("ip", ip)
         # Check if the IP is already present in the Redis cache
         ip_report_redis = check_ip_report(ip)
+        record_cache("ip", bool(ip_report_redis))
         if ip_report_redis:
-            print("IP Check: Cache Hit!")
-
-            response = json.loads(ip_report_redis)
-
-            # !Trigger Push Notification if malicious (IP)
-            try:
-                threat = response["threat"]
-                # print("moye moye", threat)
-                if threat['is_known_attacker'] and threat['is_known_abuser'] and threat['is_threat']:
-                    asyncio.create_task(send_notif(title="Malicious IP found",
-                                                body=f"{ip} is malicious for {package}"))
-                    # TODO: ^^ Needs asyncio to be implemented
-            except:
-                pass
-
-            return response
+            logger.debug("IP Check: Cache Hit!", extra={"ip": ip})
+            ip_report_data = json.loads(ip_report_redis)
         else:
-            print("IP Check: No Cache Found!")
+            logger.debug("IP Check: No Cache Found!", extra={"ip": ip})
             # Fetch the IP report from ipdata.co
             ip_report_data = ip_report(ip)
             ip_report_data['request'] = {
@@ -468,42 +546,23 @@ async def ip_or_domain_report(package: str, port: int | None = None, ip: str | N
                 "protocol": protocol
             }
 
-            # !Trigger Push Notification if malicious (IP)
-            try:
-                threat = ip_report_data["threat"]
-                # print("moye moye", threat)
-                if threat['is_known_attacker'] and threat['is_known_abuser'] and threat['is_threat']:
-                    asyncio.create_task(send_notif(title="Malicious IP found",
-                                                body=f"{ip} is malicious for {package}"))
-                    # TODO: ^^ Needs asyncio to be implemented
-            except:
-                pass
-
             # Store the IP report in the Redis cache
             add_ip_report(ip, port, package, json.dumps(ip_report_data))
-            return ip_report_data
+
+        return ip_report_data, "Malicious IP found" if _is_malicious_ip(ip_report_data) else None
     elif domain:
-        # type = "domain"
+        # Subdomains share the cache entry of their registered domain
+        domain_key = registered_domain(domain)
+        cache_warmer.record("domain", domain_key)
         # Check if the domain is already present in the Redis cache
-        domain_report_redis = check_domain_report(domain)
+        domain_report_redis = check_domain_report(domain_key)
+        record_cache("domain", bool(domain_report_redis))
         if domain_report_redis:
-            print("Domain Check: Cache Hit!")
-
-            response = json.loads(domain_report_redis)
-
-            # !Trigger Push Notification if malicious (Domain)
-            try:
-                if response['score'] < 0:
-                    asyncio.create_task(send_notif(title="Malicious Domain found",
-                                                body=f"{domain} is malicious for {package}"))
-                    # TODO: ^^ Needs asyncio to be implemented
-            except:
-                pass
-
-            return response
+            logger.debug("Domain Check: Cache Hit!", extra={"domain": domain})
+            domain_report_data = json.loads(domain_report_redis)
         else:
-            print("Domain Check: No Cache Found!")
-            # Fetch the domain report from ipdata.co
+            logger.debug("Domain Check: No Cache Found!", extra={"domain": domain})
+            # Fetch the domain report from Spamhaus
             domain_report_data = domain_report(domain)
             domain_report_data['request'] = {
                 "package": package,
@@ -511,34 +570,131 @@ async def ip_or_domain_report(package: str, port: int | None = None, ip: str | N
                 "protocol": protocol
             }
 
-            # !Trigger Push Notification if malicious (Domain)
-            try:
-                if domain_report_data['score'] < 0:
-                    asyncio.create_task(send_notif(title="Malicious Domain found",
-                                                body=f"{domain} is malicious for {package}"))
-                    # TODO: ^^ Needs asyncio to be implemented
-            except:
-                pass
-
             # Store the domain report in the Redis cache
-            add_domain_report(domain, package, json.dumps(domain_report_data))
-            return domain_report_data
+            add_domain_report(domain_key, package, json.dumps(domain_report_data))
+
+        return domain_report_data, "Malicious Domain found" if _is_malicious_domain(domain_report_data) else None
     else:
-        raise HTTPException(
-            status_code=500, detail="Incorrect Parameters Provided")
+        raise ValueError("Incorrect Parameters Provided")
+
+
+@app.get("/dynamic/ipdom")
+async def ip_or_domain_report(package: str, port: int | None = None, ip: str | None = None, domain: str | None = None, protocol: int | None = None):
+    try:
+        report, alert = await run_in_threadpool(ip_or_domain_lookup, package, port, ip, domain, protocol)
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # !Trigger Push Notification if malicious
+    if alert:
+        asyncio.create_task(send_notif(title=alert, body=f"{ip or domain} is malicious for {package}"))
+
+    return report
+
+
+def _ip_or_domain_event(event: dict) -> tuple[dict, str | None]:
+    if not isinstance(event, dict) or not event.get("package"):
+        raise ValueError("Incorrect Parameters Provided")
+    return ip_or_domain_lookup(event["package"], event.get("port"), event.get("ip"), event.get("domain"), event.get("protocol"))
+
+
+@app.websocket("/dynamic/ipdom/ws")
+async def ip_or_domain_stream(websocket: WebSocket):
+    """Streaming variant of `/dynamic/ipdom` for on-device VPN clients
+
+    The device sends one JSON connection event per message, with the same
+    fields as the query params of `/dynamic/ipdom` plus an optional `id`.
+    Lookups run concurrently but verdicts are sent back in the order the
+    events arrived. Once `IPDOM_STREAM_MAX_PENDING` lookups are pending the
+    server stops reading from the socket until the oldest one is sent.
+
+    Example:
+        Send: `{"id": 1, "package": "com.android.chrome", "domain": "example.com", "protocol": 6}`
+
+        Receive: `{"id": 1, "type": "verdict", "report": {...}}`, followed by
+        `{"id": 1, "type": "alert", "title": "Malicious Domain found", "body": "..."}`
+        if the domain is malicious, or `{"id": 1, "type": "error", "detail": "..."}`
+    """
+    await websocket.accept()
+    pending: asyncio.Queue = asyncio.Queue(maxsize=IPDOM_STREAM_MAX_PENDING)
+
+    async def receive_events():
+        while True:
+            message = await websocket.receive_text()
+            try:
+                event = json.loads(message)
+                lookup = asyncio.ensure_future(run_in_threadpool(_ip_or_domain_event, event))
+            except ValueError as e:
+                event = {}
+                lookup = asyncio.get_running_loop().create_future()
+                lookup.set_exception(e)
+            await pending.put((event, lookup))
+
+    async def send_verdicts():
+        while True:
+            event, lookup = await pending.get()
+            event_id = event.get("id") if isinstance(event, dict) else None
+            try:
+                report, alert = await lookup
+            except Exception as e:
+                await websocket.send_json({"id": event_id, "type": "error", "detail": str(e)})
+                continue
+
+            await websocket.send_json({"id": event_id, "type": "verdict", "report": report})
+            if alert:
+                body = f"{event.get('ip') or event.get('domain')} is malicious for {event['package']}"
+                await websocket.send_json({"id": event_id, "type": "alert", "title": alert, "body": body})
+                asyncio.create_task(send_notif(title=alert, body=body))
+
+    receiver = asyncio.create_task(receive_events())
+    sender = asyncio.create_task(send_verdicts())
+    try:
+        done, _ = await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        receiver.cancel()
+        sender.cancel()
+        await asyncio.wait({receiver, sender})
+
+    for task in done:
+        error = None if task.cancelled() else task.exception()
+        if error is not None and not isinstance(error, WebSocketDisconnect):
+            raise error
+    if websocket.client_state == WebSocketState.CONNECTED:
+        await websocket.close()
 
 
 @app.post("/dynamic/url_report")
 async def url_report(package: str, url: str):
     try:
-        response = requests.get(
-            f"https://www.ipqualityscore.com/api/json/url/{os.environ['IPQUALITYSCORE_API_KEY']}/{urllib.parse.quote(url, safe='')}")
-        response = response.json()
+        response = await ipqs_url_report(url)
         response['package'] = package
         return response
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+class URLReportBatchPOST(BaseModel):
+    package: str
+    urls: List[str]
+
+
+@app.post("/dynamic/url_report/batch")
+async def url_report_batch(q: URLReportBatchPOST):
+    """Batch URL report route (POST), for all URLs seen in one device session
+
+    Example:
+        Command: `curl -X POST -H 'Content-Type: application/json' -d '{"package": "com.android.chrome", "urls": ["https://example.com/?utm_source=x"]}' http://<api-server-endpoint>/dynamic/url_report/batch`
+
+        Response: `{"package": "com.android.chrome", "reports": [{"url": "https://example.com/?utm_source=x", ...}]}`
+    """
+    if len(q.urls) > URL_REPORT_BATCH_MAX:
+        raise HTTPException(
+            status_code=400, detail=f"At most {URL_REPORT_BATCH_MAX} URLs per batch")
+    try:
+        return {"package": q.package, "reports": await ipqs_url_reports(q.urls)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Blacklist POST & GET
 
 
@@ -0,0 +1,103 @@
+import os
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess
+
+load_dotenv()
+
+REQUEST_LATENCY = Histogram(
+    "securenet_request_duration_seconds", "HTTP request latency by route",
+    ["method", "route", "status"])
+
+CACHE_LOOKUPS = Counter(
+    "securenet_cache_lookups_total", "Cache lookups by cache and result (hit/miss)",
+    ["cache", "result"])
+
+UPSTREAM_LATENCY = Histogram(
+    "securenet_upstream_duration_seconds", "Upstream call latency by provider",
+    ["provider", "operation"])
+
+UPSTREAM_ERRORS = Counter(
+    "securenet_upstream_errors_total", "Failed upstream calls (exceptions and HTTP errors) by provider",
+    ["provider", "operation"])
+
+CACHE_WARMER_REFRESHES = Counter(
+    "securenet_cache_warmer_refreshes_total", "Reports refreshed ahead of expiry by the cache warmer",
+    ["cache", "result"])
+
+MOBSF_SCAN_DURATION = Histogram(
+    "securenet_mobsf_scan_duration_seconds", "MobSF upload + static scan duration",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, float("inf")))
+
+GEMINI_LATENCY = Histogram(
+    "securenet_gemini_duration_seconds", "Gemini generate_content latency",
+    ["endpoint"], buckets=(0.5, 1, 2.5, 5, 10, 20, 30, 60, float("inf")))
+
+GEMINI_TOKENS = Counter(
+    "securenet_gemini_tokens_total", "Gemini tokens by endpoint and kind (prompt/candidates)",
+    ["endpoint", "kind"])
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_upstream_error(provider: str, operation: str):
+    UPSTREAM_ERRORS.labels(provider, operation).inc()
+
+
+class UpstreamCall:
+    """Handle yielded by `track_upstream`, counts the call as an error at most once"""
+
+    def __init__(self, provider: str, operation: str, ok_statuses: tuple[int, ...] = ()):
+        self.provider = provider
+        self.operation = operation
+        self.ok_statuses = ok_statuses
+        self.failed = False
+
+    def fail(self):
+        if not self.failed:
+            self.failed = True
+            record_upstream_error(self.provider, self.operation)
+
+    def status(self, status_code: int):
+        """Count an HTTP error response (>= 400, unless in `ok_statuses`) as a failure"""
+        if status_code >= 400 and status_code not in self.ok_statuses:
+            self.fail()
+
+
+@contextmanager
+def track_upstream(provider: str, operation: str, ok_statuses: tuple[int, ...] = ()):
+    """Time an upstream call, counting it as an error if it raises
+
+    Yields an `UpstreamCall`, pass the response status to `status()` so
+    HTTP errors are counted too.
+    """
+    call = UpstreamCall(provider, operation, ok_statuses)
+    start = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        call.fail()
+        raise
+    finally:
+        UPSTREAM_LATENCY.labels(provider, operation).observe(time.perf_counter() - start)
+
+
+def record_gemini_usage(endpoint: str, response):
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    GEMINI_TOKENS.labels(endpoint, "prompt").inc(getattr(usage, "prompt_token_count", 0) or 0)
+    GEMINI_TOKENS.labels(endpoint, "candidates").inc(getattr(usage, "candidates_token_count", 0) or 0)
+
+
+def latest_metrics() -> tuple[bytes, str]:
+    """Exposition payload and content type, aggregated across workers
+    when `PROMETHEUS_MULTIPROC_DIR` is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
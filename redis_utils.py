@@ -6,23 +6,28 @@ import os
 load_dotenv()
 
 HOST = os.getenv("REDIS_HOST") if os.getenv("REDIS_HOST") else 'localhost'
+PORT = os.getenv("REDIS_PORT") if os.getenv("REDIS_PORT") else '6379'
 
-redis_client = redis.Redis(host=HOST, port='6379', db=0)
-auth_store = redis.Redis(host=HOST, port='6379', db=1)
-blacklist_sync_client = redis.Redis(host=HOST, port='6379', db=2)
+redis_client = redis.Redis(host=HOST, port=PORT, db=0)
+auth_store = redis.Redis(host=HOST, port=PORT, db=1)
+blacklist_sync_client = redis.Redis(host=HOST, port=PORT, db=2)
 
 
 def check_spamhaus_token() -> str:
-    if (auth_store.get("spamhaus_token")):
-        spamhaus_token = auth_store.get("spamhaus_token")
-        return spamhaus_token
-    return None
+    return auth_store.get("spamhaus_token")
 
 
-def add_spamhaus_token(token: str):
-    response = auth_store.set("spamhaus_token", token)
-    auth_store.expire("spamhaus_token", 60 * 60 * 12) # 12 Hours Expiry Time
-    return response
+def add_spamhaus_token(token: str, ttl: int = 60 * 60 * 12):  # 12 Hours Expiry Time
+    return auth_store.set("spamhaus_token", token, ex=ttl)
+
+
+def remove_spamhaus_token():
+    return auth_store.delete("spamhaus_token")
+
+
+def spamhaus_token_lock(timeout: int):
+    # Cross-worker lock so only one process logs in to Spamhaus at a time
+    return auth_store.lock("spamhaus_token:lock", timeout=timeout, blocking_timeout=timeout)
 
 
 def check_ip_report(ip: str):
@@ -50,6 +55,35 @@ def add_domain_report(domain: str, package_name: str, report: str):
     redis_client.expire(key, 60 * 60 * 24 * 7)  # Expire after 7 days
     return response
 
+
+def check_url_report(url: str):
+    key = f"url:{url}"
+    return redis_client.get(key)
+
+
+def check_url_reports(urls: list[str]) -> list:
+    # Single MGET for a whole batch, None for misses
+    if not urls:
+        return []
+    return redis_client.mget([f"url:{url}" for url in urls])
+
+
+def add_url_report(url: str, report: str, ttl: int):
+    key = f"url:{url}"
+    return redis_client.set(key, report, ex=ttl)
+
+def get_report_ttls(keys: list[str]) -> list[int]:
+    # Single round trip, -2 for missing keys and -1 for keys without expiry
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        pipe.ttl(key)
+    return pipe.execute()
+
+
+def claim_report_refresh(key: str, ttl: int) -> bool:
+    # Only one worker refreshes a given report per warming cycle
+    return bool(redis_client.set(f"warm:{key}", 1, nx=True, ex=ttl))
+
 # Utils for Blacklists Sync (SETS)
 def add_ip_to_blacklist(ip: str):
     blacklist_sync_client.sadd("blacklist:ips", ip)
@@ -0,0 +1,10 @@
+"""Test setup
+
+Usage:
+    pip install -r tests/requirements.txt
+    python -m pytest tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import fakeredis
+import pytest
+import requests
+import cache_warmer
+import ipdata_utils
+import redis_utils
+import spamhaus_utils
+from metrics_utils import CACHE_WARMER_REFRESHES
+
+
+def _response(status_code: int, body: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    return response
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis_utils, "redis_client", client)
+    monkeypatch.setenv("IPDATA_API_KEY", "test")
+    monkeypatch.setattr(spamhaus_utils, "spamhaus_token", lambda: "test")
+    return client
+
+
+def _warm(kind: str, key: str) -> int:
+    warmer = cache_warmer.CacheWarmer(min_hits=1, budget=10)
+    warmer.record(kind, key)
+    return asyncio.run(warmer.warm_once())
+
+
+def _errors(kind: str) -> float:
+    return CACHE_WARMER_REFRESHES.labels(kind, "error")._value.get()
+
+
+def test_failed_ip_refresh_keeps_cached_report(redis_client, monkeypatch):
+    cached = json.dumps({"threat": {"is_known_attacker": True, "is_known_abuser": True, "is_threat": True}})
+    redis_client.set("6.6.6.6", cached, ex=100)
+    monkeypatch.setattr(ipdata_utils.requests, "get",
+                        lambda *args, **kwargs: _response(503, {"message": "Service unavailable"}))
+    errors = _errors("ip")
+
+    assert _warm("ip", "6.6.6.6") == 1
+    assert redis_client.get("6.6.6.6") == cached.encode()
+    assert redis_client.ttl("6.6.6.6") <= 100
+    assert _errors("ip") == errors + 1
+
+
+def test_failed_domain_refresh_keeps_cached_report(redis_client, monkeypatch):
+    cached = json.dumps({"domain": "evil.com", "score": -3})
+    redis_client.set("evil.com", cached, ex=100)
+    monkeypatch.setattr(spamhaus_utils.requests, "get",
+                        lambda *args, **kwargs: _response(503, {"message": "Service unavailable"}))
+    errors = _errors("domain")
+
+    assert _warm("domain", "evil.com") == 1
+    assert redis_client.get("evil.com") == cached.encode()
+    assert redis_client.ttl("evil.com") <= 100
+    assert _errors("domain") == errors + 1
+
+
+def test_successful_refresh_replaces_report(redis_client, monkeypatch):
+    redis_client.set("evil.com", json.dumps({"score": -3, "request": {"package": "p"}}), ex=100)
+    monkeypatch.setattr(spamhaus_utils.requests, "get",
+                        lambda *args, **kwargs: _response(200, {"domain": "evil.com", "score": -5}))
+
+    assert _warm("domain", "evil.com") == 1
+    report = json.loads(redis_client.get("evil.com"))
+    assert report["score"] == -5
+    assert report["request"] == {"package": "p"}
+    assert redis_client.ttl("evil.com") > 100
@@ -0,0 +1,56 @@
+import os
+import time
+import fakeredis
+import pytest
+
+os.environ.setdefault("URL_DATABASE", "sqlite://")
+os.environ.setdefault("CACHE_WARMER_ENABLED", "false")
+
+from fastapi.testclient import TestClient
+import main
+import redis_utils
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(redis_utils, "redis_client", fakeredis.FakeRedis())
+    notifications = []
+
+    def domain_report(domain):
+        # The first event is the slowest, its verdict must still come first
+        time.sleep(0.2 if domain == "slow.com" else 0)
+        return {"domain": domain, "score": -5 if domain == "evil.com" else 5, "type": "domain"}
+
+    async def send_notif(title, body):
+        notifications.append((title, body))
+
+    monkeypatch.setattr(main, "domain_report", domain_report)
+    monkeypatch.setattr(main, "send_notif", send_notif)
+    client = TestClient(main.app)
+    client.notifications = notifications
+    return client
+
+
+def test_verdicts_alerts_and_errors_in_order(client):
+    with client.websocket_connect("/dynamic/ipdom/ws") as websocket:
+        websocket.send_json({"id": 1, "package": "com.example", "domain": "slow.com"})
+        websocket.send_json({"id": 2, "package": "com.example", "domain": "evil.com"})
+        websocket.send_json({"id": 3, "domain": "example.com"})
+        websocket.send_text("not json")
+        websocket.send_json({"id": 5, "package": "com.example", "domain": "example.com"})
+        frames = [websocket.receive_json() for _ in range(6)]
+
+    assert [(frame["id"], frame["type"]) for frame in frames] == [
+        (1, "verdict"), (2, "verdict"), (2, "alert"), (3, "error"), (None, "error"), (5, "verdict")]
+    assert frames[0]["report"]["domain"] == "slow.com"
+    assert frames[2]["title"] == "Malicious Domain found"
+    assert frames[3]["detail"] == "Incorrect Parameters Provided"
+    assert client.notifications == [("Malicious Domain found", "evil.com is malicious for com.example")]
+
+
+def test_http_route_matches_stream(client):
+    response = client.get("/dynamic/ipdom", params={"package": "com.example", "domain": "evil.com"})
+
+    assert response.status_code == 200
+    assert response.json()["score"] == -5
+    assert response.json()["request"]["package"] == "com.example"
@@ -0,0 +1,96 @@
+import asyncio
+import json
+import fakeredis
+import pytest
+import ipqualityscore_utils
+import redis_utils
+
+
+@pytest.fixture
+def redis_client(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis_utils, "redis_client", client)
+    return client
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Fake IPQualityScore: returns `reports[url]` after a short delay, counting calls"""
+    calls = []
+    reports = {}
+
+    async def request_url_report(url):
+        calls.append(url)
+        await asyncio.sleep(0.05)
+        return dict(reports.get(url, {"success": True, "risk_score": 0}))
+    monkeypatch.setattr(ipqualityscore_utils, "_request_url_report", request_url_report)
+    return calls, reports
+
+
+def test_normalize_url_keeps_ipv6_brackets():
+    assert ipqualityscore_utils.normalize_url("http://[::1]:8080/x") == "http://[::1]:8080/x"
+    assert ipqualityscore_utils.normalize_url("https://[2001:db8::1]:443/?utm_source=a") == "https://[2001:db8::1]/"
+
+
+def test_normalize_url_strips_tracking_params():
+    assert ipqualityscore_utils.normalize_url(
+        "HTTPS://Example.COM:443/a?utm_source=x&b=2&a=1#frag") == "https://example.com/a?a=1&b=2"
+
+
+def test_concurrent_misses_share_one_upstream_call(redis_client, upstream):
+    calls, _ = upstream
+
+    async def lookups():
+        return await asyncio.gather(*(ipqualityscore_utils.url_report(f"example.com/?utm_source={i}")
+                                      for i in range(10)))
+
+    reports = asyncio.run(lookups())
+    assert calls == ["http://example.com/"]
+    assert len(reports) == 10
+    # Each caller gets its own copy
+    reports[0]["package"] = "p"
+    assert "package" not in reports[1]
+
+
+def test_ttl_follows_verdict(redis_client, upstream):
+    _, reports = upstream
+    reports["http://bad.com/"] = {"success": True, "malware": True, "risk_score": 100}
+    reports["http://meh.com/"] = {"success": True, "suspicious": True, "risk_score": 80}
+
+    asyncio.run(ipqualityscore_utils.url_reports(["bad.com", "meh.com", "ok.com"]))
+    ttl = ipqualityscore_utils.URL_REPORT_TTL
+    assert 0 <= ttl["malicious"] - redis_client.ttl("url:http://bad.com/") <= 1
+    assert 0 <= ttl["suspicious"] - redis_client.ttl("url:http://meh.com/") <= 1
+    assert 0 <= ttl["clean"] - redis_client.ttl("url:http://ok.com/") <= 1
+
+
+def test_error_verdict_is_not_cached(redis_client, upstream):
+    calls, reports = upstream
+    reports["http://down.com/"] = {"success": False, "message": "Service unavailable"}
+
+    asyncio.run(ipqualityscore_utils.url_report("down.com"))
+    assert redis_client.get("url:http://down.com/") is None
+    asyncio.run(ipqualityscore_utils.url_report("down.com"))
+    assert calls == ["http://down.com/", "http://down.com/"]
+
+
+def test_batch_serves_cache_hits_without_upstream(redis_client, upstream):
+    calls, _ = upstream
+    redis_client.set("url:http://cached.com/", json.dumps({"success": True, "risk_score": 5}))
+
+    reports = asyncio.run(ipqualityscore_utils.url_reports(["cached.com", "new.com"]))
+    assert reports[0] == {"success": True, "risk_score": 5, "url": "cached.com"}
+    assert calls == ["http://new.com/"]
+
+
+def test_url_reports_reports_cancelled_lookup(redis_client, monkeypatch):
+    async def coalesced_fetch(url):
+        if url == "http://cancelled.com/":
+            raise asyncio.CancelledError()
+        return {"success": True}
+    monkeypatch.setattr(ipqualityscore_utils, "_coalesced_fetch", coalesced_fetch)
+
+    reports = asyncio.run(ipqualityscore_utils.url_reports(["ok.com", "cancelled.com"]))
+    assert reports[0] == {"success": True, "url": "ok.com"}
+    assert reports[1]["url"] == "cancelled.com"
+    assert "error" in reports[1]
@@ -0,0 +1,24 @@
+import io
+import json
+import logging
+import sys
+import logging_utils
+
+
+def test_exception_traceback_goes_to_exc_field():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging_utils.JSONFormatter())
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger = logging.getLogger("test")
+        record = logger.makeRecord("test", logging.ERROR, __file__, 0, "failed %s", ("here",),
+                                   sys.exc_info(), extra={"key": "value"})
+
+    handler.emit(logging_utils._QueueHandler(None).prepare(record))
+    entry = json.loads(stream.getvalue())
+    assert entry["msg"] == "failed here"
+    assert entry["key"] == "value"
+    assert "ValueError: boom" in entry["exc"]
+    assert "Traceback" not in entry["msg"]
@@ -0,0 +1,27 @@
+import pytest
+from metrics_utils import UPSTREAM_ERRORS, track_upstream
+
+
+def _errors(operation: str) -> float:
+    return UPSTREAM_ERRORS.labels("test", operation)._value.get()
+
+
+@pytest.mark.parametrize("status_code, failed", [(200, False), (404, False), (429, True), (503, True)])
+def test_http_errors_are_counted(status_code, failed):
+    errors = _errors("status")
+
+    with track_upstream("test", "status", ok_statuses=(404,)) as call:
+        call.status(status_code)
+
+    assert _errors("status") == errors + failed
+
+
+def test_error_response_that_raises_is_counted_once():
+    errors = _errors("raise")
+
+    with pytest.raises(ValueError):
+        with track_upstream("test", "raise") as call:
+            call.status(500)
+            raise ValueError("no usable body")
+
+    assert _errors("raise") == errors + 1
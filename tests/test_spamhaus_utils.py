@@ -0,0 +1,115 @@
+import base64
+import json
+import threading
+import time
+import fakeredis
+import pytest
+import requests
+import redis_utils
+import spamhaus_utils
+
+
+def _jwt(iat: float, exp: float) -> str:
+    payload = base64.urlsafe_b64encode(json.dumps({"iat": int(iat), "exp": int(exp)}).encode()).decode().rstrip("=")
+    return f"header.{payload}.signature"
+
+
+def _response(status_code: int, body: dict) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = json.dumps(body).encode()
+    return response
+
+
+@pytest.fixture
+def auth_store(monkeypatch):
+    client = fakeredis.FakeRedis()
+    monkeypatch.setattr(redis_utils, "auth_store", client)
+    monkeypatch.setenv("SPAMHAUS_USERNAME", "test")
+    monkeypatch.setenv("SPAMHAUS_PASSWORD", "test")
+    return client
+
+
+@pytest.fixture
+def logins(monkeypatch):
+    """Tokens handed out by the fake login endpoint, in order"""
+    issued = []
+
+    def post(*args, **kwargs):
+        time.sleep(0.05)
+        now = time.time()
+        issued.append(_jwt(now, now + 3600) + str(len(issued)))
+        return _response(200, {"token": issued[-1]})
+
+    monkeypatch.setattr(spamhaus_utils.requests, "post", post)
+    return issued
+
+
+def test_cold_start_logs_in_once(auth_store, logins):
+    manager = spamhaus_utils.SpamhausTokenManager()
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(manager.get_token())) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(logins) == 1
+    assert tokens == logins * 20
+    # A second worker adopts the stored token instead of logging in
+    assert spamhaus_utils.SpamhausTokenManager().get_token() == logins[0]
+    assert len(logins) == 1
+
+
+def test_revoked_token_is_replaced_and_retried(auth_store, logins, monkeypatch):
+    manager = spamhaus_utils.SpamhausTokenManager()
+    monkeypatch.setattr(spamhaus_utils, "token_manager", manager)
+    revoked = manager.get_token()
+    seen = []
+
+    def get(url, headers):
+        seen.append(headers["Authorization"])
+        if headers["Authorization"] == f"Bearer {revoked}":
+            return _response(401, {"message": "Unauthorized"})
+        return _response(200, {"domain": "evil.com", "score": -3})
+
+    monkeypatch.setattr(spamhaus_utils.requests, "get", get)
+
+    assert spamhaus_utils.fetch_domain_report("evil.com")["score"] == -3
+    assert seen == [f"Bearer {revoked}", f"Bearer {logins[1]}"]
+    assert auth_store.get("spamhaus_token") == logins[1].encode()
+
+
+def test_failed_refresh_backs_off(auth_store, monkeypatch):
+    attempts = []
+
+    def post(*args, **kwargs):
+        attempts.append(time.time())
+        return _response(503, {"message": "Service unavailable"})
+
+    monkeypatch.setattr(spamhaus_utils.requests, "post", post)
+    manager = spamhaus_utils.SpamhausTokenManager(refresh_margin=600, backoff=60)
+    now = time.time()
+    # Inside the refresh window but still valid
+    manager._set(_jwt(now - 3000, now + 300))
+
+    for _ in range(50):
+        assert manager.get_token()
+        time.sleep(0.002)
+
+    assert len(attempts) == 1
+    assert manager._next_attempt_at >= attempts[0] + 60
+
+
+def test_short_lived_token_is_not_refreshed_immediately(auth_store, logins):
+    manager = spamhaus_utils.SpamhausTokenManager(refresh_margin=600)
+    now = time.time()
+    # Lifetime shorter than the margin, refresh starts halfway through
+    manager._set(_jwt(now, now + 120))
+
+    for _ in range(10):
+        manager.get_token()
+    time.sleep(0.1)
+
+    assert logins == []
+    assert manager._refresh_at == pytest.approx(now + 60, abs=1)